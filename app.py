@@ -5,15 +5,24 @@ Uses Groq's OpenAI-compatible chat completions API.
 """
 
 import os
-import json
 import io
 import csv
+import operator
 import datetime
-from typing import List, Dict, Any
+import importlib.util
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List, Dict, Any, Sequence, Union, Callable, Optional, Tuple
 
+import pandas as pd
 import streamlit as st
 from dotenv import load_dotenv
-import requests
+import httpx
+
+from groq_cache import Cacher, SingleFlight, make_key, DEFAULT_CACHE_PATH
+from post_schema import Post, POSTS_ADAPTER
+from json_utils import json_loads, json_dumps
 
 # ---------------------------------------------------------
 # Load environment variables
@@ -26,21 +35,55 @@ GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
 # Groq OpenAI-compatible chat completions endpoint
 GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
 
+# Calendar generation is split into windows of this many days, requested concurrently
+CHUNK_DAYS = 3
+MAX_WORKERS = 6
+CHUNK_RETRIES = 1
+
+# Completion budget per chunk: base + per-post allowance (plus the caption,
+# at roughly 4 characters per token), capped
+BASE_MAX_TOKENS = 200
+TOKENS_PER_POST = 130
+MAX_TOKENS_CAP = 8000
+
+# Connection pool and retry policy for Groq calls
+POOL_MAX_CONNECTIONS = 8
+POOL_MAX_KEEPALIVE = 4
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+MAX_RETRY_AFTER = 30  # seconds; longer Retry-After values fail fast
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Generated calendars are memoized in memory for repeat submissions
+CALENDAR_CACHE_TTL = 3600
+CALENDAR_CACHE_ENTRIES = 100
+
+# On-disk response cache (see groq_cache.py)
+GROQ_CACHE_PATH = os.getenv("GROQ_CACHE_PATH", DEFAULT_CACHE_PATH)
+
 if not GROQ_API_KEY:
     st.stop()  # stops app if key missing
     raise SystemExit("ERROR: GROQ_API_KEY missing in .env")
 
 # ---------------------------------------------------------
-# Prompt Templates
+# Prompts
 # ---------------------------------------------------------
-MASTER_PROMPT_TEMPLATE = """
-Generate a {duration}-day social media content calendar for these platforms: {platforms}.
-Tone: {tone}.
-Audience: {audience}.
-Start date: {start_date}.
-Caption limit: {char_limit} characters.
-
-Each post must include:
+# System prompts hold every fixed instruction and contain no interpolated
+# values, so the prefix is byte-identical across calls and eligible for
+# server-side prompt caching. Per-request values go in the user message
+# as compact JSON.
+CALENDAR_SYSTEM_PROMPT = """You are a helpful social media content generator.
+
+The user message is a JSON object describing a content calendar:
+- duration: number of days
+- start_date: date of the first day (YYYY-MM-DD)
+- platforms: platforms to post on
+- tone
+- audience
+- char_limit: caption limit in characters
+- brand: brand info
+
+Generate the calendar. Each post must include:
 - id
 - date
 - platform
@@ -51,159 +94,517 @@ Each post must include:
 - alt_text
 - CTA
 
-Brand info:
-{brand_info}
+Return ONLY a JSON array."""
 
-Return ONLY a JSON array.
-"""
+SAFETY_SYSTEM_PROMPT = """You are a helpful social media content generator.
 
-SAFETY_CHECK_PROMPT = """
-Check this caption for safety. Respond with:
-{{"status":"SAFE" or "UNSAFE", "replacement":""}}
+The user message is a JSON array of {"id", "caption"} items.
+Check each caption for safety.
+For every item, output {"id": <item id>, "status": "SAFE" or "UNSAFE", "replacement": ""}.
+For UNSAFE captions, put a safe rewrite in "replacement".
 
-Caption: "{caption}"
-"""
+Return ONLY a JSON array."""
+
+# ---------------------------------------------------------
+# Shared resources (kept alive across Streamlit reruns)
+# ---------------------------------------------------------
+@st.cache_resource
+def get_session() -> httpx.Client:
+    """
+    HTTP client reused across calls so the TLS connection stays pooled.
+    With HTTP/2 the concurrent chunk requests share a single connection.
+    No custom transport is passed, so HTTPS_PROXY and friends still apply;
+    connection failures and 429/5xx responses are retried in call_groq.
+    """
+    return httpx.Client(
+        http2=importlib.util.find_spec("h2") is not None,
+        limits=httpx.Limits(
+            max_connections=POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=POOL_MAX_KEEPALIVE,
+        ),
+        timeout=40,
+        headers={
+            "Authorization": f"Bearer {GROQ_API_KEY}",
+            "Content-Type": "application/json",
+        },
+    )
+
+
+@st.cache_resource
+def get_response_cache() -> Cacher:
+    return Cacher(GROQ_CACHE_PATH)
+
+
+@st.cache_resource
+def get_calendar_cache() -> Cacher:
+    # In memory and shared by every session; see generate_calendar
+    return Cacher(
+        path=None, ttl=CALENDAR_CACHE_TTL, max_entries=CALENDAR_CACHE_ENTRIES
+    )
+
+
+@st.cache_resource
+def get_executor() -> ThreadPoolExecutor:
+    # Long-lived workers, so per-thread state (simdjson parsers) is reused
+    # across generations
+    return ThreadPoolExecutor(max_workers=MAX_WORKERS)
+
+
+@st.cache_resource
+def get_single_flight() -> SingleFlight:
+    # Shared by every session, so identical submissions from two tabs coalesce
+    return SingleFlight()
 
 # ---------------------------------------------------------
 # Groq Model Call (Chat Completions)
 # ---------------------------------------------------------
-def call_groq(prompt: str, max_tokens: int = 800) -> str:
+def _retry_delay(resp: httpx.Response, attempt: int) -> Optional[float]:
+    """
+    Seconds to wait before retrying: Groq's Retry-After when given, else
+    exponential backoff. None when the server asks for more than
+    MAX_RETRY_AFTER, so the caller fails fast instead of blocking.
+    """
+    try:
+        delay = max(float(resp.headers.get("Retry-After", "")), 0.0)
+    except ValueError:
+        delay = BACKOFF_FACTOR * 2**attempt
+    return delay if delay <= MAX_RETRY_AFTER else None
+
+
+def _read_completion(
+    resp: httpx.Response, on_delta: Optional[Callable[[str], None]]
+) -> str:
+    parts = []
+    # Server-sent events: "data: {...}" lines, terminated by "data: [DONE]"
+    for line in resp.iter_lines():
+        if not line.startswith("data: "):
+            continue
+        if line[6:] == "[DONE]":
+            break
+        delta = json_loads(line[6:])["choices"][0]["delta"].get("content") or ""
+        if delta:
+            parts.append(delta)
+            if on_delta is not None:
+                on_delta(delta)
+    return "".join(parts)
+
+
+def call_groq(
+    system: str,
+    prompt: str,
+    max_tokens: int = 800,
+    use_cache: bool = True,
+    on_delta: Optional[Callable[[str], None]] = None,
+    client: Optional[httpx.Client] = None,
+    response_cache: Optional[Cacher] = None,
+    single_flight: Optional[SingleFlight] = None,
+) -> str:
     """
     Calls Groq's OpenAI-compatible chat completions endpoint.
+    The response is streamed; each content delta is passed to on_delta as it
+    arrives. Identical payloads are served from the on-disk response cache,
+    and identical calls already in flight are joined rather than repeated.
+
+    client, response_cache and single_flight default to the shared
+    resources; worker threads must receive them from the script thread,
+    since st.cache_resource needs a ScriptRunContext.
     """
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json",
-    }
+    if client is None:
+        client = get_session()
+    if response_cache is None:
+        response_cache = get_response_cache()
+    if single_flight is None:
+        single_flight = get_single_flight()
 
     payload = {
         "model": GROQ_MODEL,
         "messages": [
-            {
-                "role": "system",
-                "content": "You are a helpful social media content generator.",
-            },
+            {"role": "system", "content": system},
             {"role": "user", "content": prompt},
         ],
         "max_tokens": max_tokens,
         "temperature": 0.2,
+        "stream": True,
     }
 
-    resp = requests.post(GROQ_API_URL, headers=headers, json=payload, timeout=40)
-
-    if resp.status_code != 200:
-        raise RuntimeError(f"Groq Error {resp.status_code}: {resp.text}")
-
-    data = resp.json()
-    return data["choices"][0]["message"]["content"]
+    key = make_key(payload)
+    if use_cache:
+        cached = response_cache.get(key)
+        if cached is not None:
+            if on_delta is not None:
+                on_delta(cached)
+            return cached
+
+    def request() -> str:
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                with client.stream("POST", GROQ_API_URL, json=payload) as resp:
+                    if resp.status_code == 200:
+                        content = _read_completion(resp, on_delta)
+                        response_cache.put(key, content)
+                        return content
+                    resp.read()
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                # Nothing was sent yet, so reconnecting is always safe
+                if attempt == MAX_RETRIES:
+                    raise
+                time.sleep(BACKOFF_FACTOR * 2**attempt)
+                continue
+
+            # The response is closed before waiting
+            delay = _retry_delay(resp, attempt)
+            if (
+                resp.status_code not in RETRY_STATUSES
+                or attempt == MAX_RETRIES
+                or delay is None
+            ):
+                raise RuntimeError(f"Groq Error {resp.status_code}: {resp.text}")
+            time.sleep(delay)
+
+    content, shared = single_flight.do(key, request)
+    if shared and on_delta is not None:
+        on_delta(content)
+    return content
 
 # ---------------------------------------------------------
 # JSON Extraction Helper
 # ---------------------------------------------------------
-def extract_json(text: str) -> List[Dict[str, Any]]:
-    text = text.strip()
+def extract_json(text: Union[str, bytes]) -> List[Dict[str, Any]]:
+    # Scan bytes so find/rfind use memchr instead of a str scan
+    data = text.encode("utf-8") if isinstance(text, str) else text
+    data = data.strip()
 
-    if text.startswith("["):
-        return json.loads(text)
+    if data.startswith(b"["):
+        return json_loads(data)
 
-    first = text.find("[")
-    last = text.rfind("]")
+    first = data.find(b"[")
+    last = data.rfind(b"]")
 
     if first == -1 or last == -1:
         raise ValueError("No JSON array found in response")
 
-    return json.loads(text[first : last + 1])
+    return json_loads(data[first : last + 1])
+
+class _ArrayItemStream:
+    """
+    Incremental scanner for a streamed JSON array: feed() returns each
+    top-level object as soon as its closing brace has arrived.
+    """
+
+    def __init__(self):
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._buf: List[str] = []
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        items = []
+        for ch in text:
+            if not self._started:
+                self._started = ch == "["
+                continue
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+                    self._buf = [ch]
+                continue
+
+            self._buf.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        item = json_loads("".join(self._buf))
+                    except ValueError:
+                        continue
+                    if isinstance(item, dict):
+                        items.append(item)
+        return items
+
+
+def _make_preview_sink(out: "queue.Queue[Dict[str, Any]]") -> Callable[[str], None]:
+    """
+    on_delta callback that queues each post as soon as it is complete.
+    """
+    items = _ArrayItemStream()
+
+    def on_delta(delta: str):
+        for post in items.feed(delta):
+            out.put(post)
+
+    return on_delta
 
 # ---------------------------------------------------------
 # Generate Calendar
 # ---------------------------------------------------------
-def generate_calendar(
+def build_calendar(
     brand_info: str,
     tone: str,
     audience: str,
-    platforms: List[str],
+    platforms: Sequence[str],
     duration: int,
     start_date: str,
     char_limit: int,
+    use_cache: bool = True,
+    on_post: Optional[Callable[[Dict[str, Any]], None]] = None,
 ):
-    prompt = MASTER_PROMPT_TEMPLATE.format(
-        duration=duration,
-        platforms=", ".join([p.strip() for p in platforms]),
-        tone=tone,
-        audience=audience,
-        start_date=start_date,
-        char_limit=char_limit,
-        brand_info=brand_info,
-    )
+    """
+    Uncached calendar generation. on_post is called on the calling thread
+    with each post as it streams in, before the calendar is complete.
+    """
+    first_day = datetime.date.fromisoformat(start_date)
+    windows = [
+        (first_day + datetime.timedelta(days=offset), min(CHUNK_DAYS, duration - offset))
+        for offset in range(0, duration, CHUNK_DAYS)
+    ]
 
-    raw = call_groq(prompt, max_tokens=1400)
-    posts = extract_json(raw)
+    platform_list = [p.strip() for p in platforms]
 
-    # Normalization
+    def chunk_max_tokens(chunk_days: int) -> int:
+        posts_in_chunk = chunk_days * max(len(platforms), 1)
+        per_post = TOKENS_PER_POST + char_limit // 4
+        return min(BASE_MAX_TOKENS + per_post * posts_in_chunk, MAX_TOKENS_CAP)
+
+    streamed: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+
+    # Resolved here on the script thread and handed to the workers
+    client = get_session()
+    response_cache = get_response_cache()
+    single_flight = get_single_flight()
+    executor = get_executor()
+
+    def generate_chunk(
+        window, cached: bool = True, preview: bool = False
+    ) -> List[Post]:
+        chunk_start, chunk_days = window
+        prompt = json_dumps(
+            {
+                "duration": chunk_days,
+                "start_date": chunk_start.isoformat(),
+                "platforms": platform_list,
+                "tone": tone,
+                "audience": audience,
+                "char_limit": char_limit,
+                "brand": brand_info,
+            }
+        ).decode("utf-8")
+        on_delta = _make_preview_sink(streamed) if preview else None
+        raw = call_groq(
+            CALENDAR_SYSTEM_PROMPT,
+            prompt,
+            max_tokens=chunk_max_tokens(chunk_days),
+            use_cache=cached,
+            on_delta=on_delta,
+            client=client,
+            response_cache=response_cache,
+            single_flight=single_flight,
+        )
+        # Malformed posts raise here, so the chunk is retried like any failure
+        return POSTS_ADAPTER.validate_python(extract_json(raw))
+
+    def try_chunk(window):
+        try:
+            return generate_chunk(window, cached=use_cache, preview=on_post is not None)
+        except Exception as e:
+            return e
+
+    futures = [executor.submit(try_chunk, window) for window in windows]
+    if on_post is None:
+        wait(futures)
+    else:
+        # Streamlit elements may only be updated from the script thread
+        while not all(f.done() for f in futures) or not streamed.empty():
+            try:
+                on_post(streamed.get(timeout=0.1))
+            except queue.Empty:
+                pass
+    results = [f.result() for f in futures]
+
+    # Retry only the chunks that failed, skipping the response cache so a
+    # malformed cached reply is not served again
+    for i, window in enumerate(windows):
+        for _ in range(CHUNK_RETRIES):
+            if not isinstance(results[i], Exception):
+                break
+            try:
+                results[i] = generate_chunk(window, cached=False)
+            except Exception as e:
+                results[i] = e
+        if isinstance(results[i], Exception):
+            raise results[i]
+
+    posts = POSTS_ADAPTER.dump_python([p for chunk in results for p in chunk])
+
+    # Ids are renumbered since each chunk starts at 1; hashtags are joined
+    # once here for the table and CSV (dropped from the JSON download)
     for i, p in enumerate(posts, start=1):
-        if "id" not in p:
-            p["id"] = i
-        if isinstance(p.get("hashtags"), str):
-            p["hashtags"] = p["hashtags"].split()
-        if "hashtags" not in p:
-            p["hashtags"] = []
+        p["id"] = i
+        p["_hashtags_str"] = " ".join(p["hashtags"])
 
     return posts
 
+
+def generate_calendar(
+    brand_info: str,
+    tone: str,
+    audience: str,
+    platforms: Sequence[str],
+    duration: int,
+    start_date: str,
+    char_limit: int,
+    on_post: Optional[Callable[[Dict[str, Any]], None]] = None,
+):
+    """
+    Cached build_calendar. The lookup runs on the calling thread outside any
+    st.cache_data function, so on_post may update Streamlit elements.
+    """
+    calendar_cache = get_calendar_cache()
+    key = make_key(
+        {
+            "brand_info": brand_info,
+            "tone": tone,
+            "audience": audience,
+            "platforms": list(platforms),
+            "duration": duration,
+            "start_date": start_date,
+            "char_limit": char_limit,
+        }
+    )
+    cached = calendar_cache.get(key)
+    if cached is not None:
+        return json_loads(cached)
+
+    posts = build_calendar(
+        brand_info,
+        tone,
+        audience,
+        platforms,
+        duration,
+        start_date,
+        char_limit,
+        on_post=on_post,
+    )
+    calendar_cache.put(key, json_dumps(posts).decode("utf-8"))
+    return posts
+
 # ---------------------------------------------------------
-# Safety Checker (optional helper, not wired into UI yet)
+# Safety Checker (all captions in a single call)
 # ---------------------------------------------------------
-def safety_check(caption: str):
-    prompt = SAFETY_CHECK_PROMPT.format(caption=caption.replace('"', '\\"'))
+def safety_check(
+    captions: List[str], use_cache: bool = True
+) -> List[Dict[str, Any]]:
+    items = [{"id": i, "caption": c} for i, c in enumerate(captions)]
+    prompt = json_dumps(items).decode("utf-8")
 
     try:
-        result = call_groq(prompt, max_tokens=200)
-        data = json.loads(result)
-        return data
+        result = call_groq(
+            SAFETY_SYSTEM_PROMPT,
+            prompt,
+            max_tokens=min(200 + 80 * len(captions), 8000),
+            use_cache=use_cache,
+        )
+        # Ids are compared as strings; the model may echo 0 back as "0"
+        checked = {
+            str(r.get("id")): r
+            for r in extract_json(result)
+            if isinstance(r, dict)
+        }
     except Exception:
-        return {"status": "SAFE", "replacement": ""}
+        checked = {}
+
+    # Captions missing from the reply are treated as SAFE, as before
+    return [
+        {
+            "id": i,
+            "status": str(checked.get(str(i), {}).get("status", "SAFE")).upper(),
+            "replacement": checked.get(str(i), {}).get("replacement", ""),
+        }
+        for i in range(len(captions))
+    ]
 
 # ---------------------------------------------------------
 # CSV Export
 # ---------------------------------------------------------
+CSV_COLUMNS = [
+    "id",
+    "date",
+    "platform",
+    "post_type",
+    "caption",
+    "hashtags",
+    "image_prompt",
+    "alt_text",
+    "CTA",
+]
+
+DISPLAY_COLUMNS = {
+    "id": "ID",
+    "date": "Date",
+    "platform": "Platform",
+    "post_type": "Type",
+    "caption": "Caption",
+    "hashtags": "Hashtags",
+    "CTA": "CTA",
+}
+
+
+def posts_to_dataframe(posts: List[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    One row per post with every CSV column present and hashtags as a string.
+    """
+    df = pd.DataFrame(posts).drop(columns="hashtags", errors="ignore")
+    return df.rename(columns={"_hashtags_str": "hashtags"}).reindex(columns=CSV_COLUMNS)
+
+
+# Pulls a post's CSV row in one C-level call; every key is guaranteed by the
+# Post schema and normalization in generate_calendar
+_csv_row = operator.itemgetter(
+    *["_hashtags_str" if c == "hashtags" else c for c in CSV_COLUMNS]
+)
+
+
 def posts_to_csv(posts: List[Dict[str, Any]]):
-    output = io.StringIO()
-    writer = csv.writer(output)
-
-    header = [
-        "id",
-        "date",
-        "platform",
-        "post_type",
-        "caption",
-        "hashtags",
-        "image_prompt",
-        "alt_text",
-        "CTA",
-    ]
-    writer.writerow(header)
+    output = io.BytesIO()
+    # Rows are encoded into the byte buffer as they are written, so the
+    # full CSV is never held as a str and a bytes copy at the same time
+    text = io.TextIOWrapper(output, encoding="utf-8", newline="")
+    writer = csv.writer(text)
 
-    for p in posts:
-        hashtags = (
-            " ".join(p["hashtags"])
-            if isinstance(p.get("hashtags"), list)
-            else p.get("hashtags", "")
-        )
-        writer.writerow(
-            [
-                p.get("id", ""),
-                p.get("date", ""),
-                p.get("platform", ""),
-                p.get("post_type", ""),
-                p.get("caption", ""),
-                hashtags,
-                p.get("image_prompt", ""),
-                p.get("alt_text", ""),
-                p.get("CTA", ""),
-            ]
-        )
+    writer.writerow(CSV_COLUMNS)
+    writer.writerows(map(_csv_row, posts))
+
+    text.flush()
+    text.detach()
+    return output.getvalue()
 
-    return output.getvalue().encode("utf-8")
+# ---------------------------------------------------------
+# UI Outputs
+# ---------------------------------------------------------
+def build_outputs(posts: List[Dict[str, Any]]) -> Tuple[pd.DataFrame, bytes, bytes]:
+    """
+    Table frame and download payloads. Built once per generation and kept in
+    session state, so other reruns (downloads, scrolling) reuse them.
+    """
+    display_df = posts_to_dataframe(posts)[list(DISPLAY_COLUMNS)].rename(
+        columns=DISPLAY_COLUMNS
+    )
+    json_bytes = json_dumps(
+        [{k: v for k, v in p.items() if not k.startswith("_")} for p in posts],
+        indent=True,
+    )
+    return display_df, json_bytes, posts_to_csv(posts)
 
 # ---------------------------------------------------------
 # Streamlit UI
@@ -213,9 +614,16 @@ st.title("📱 Groq Social Media Agent")
 
 st.caption("Generate multi-day content calendars using Groq (LLM).")
 
+# Debug: bypass the on-disk response cache
+use_cache = not st.sidebar.checkbox(
+    "Bypass response cache", value=False, help="Always call Groq (debugging)."
+)
+
 # Keep posts in session state
 if "posts" not in st.session_state:
     st.session_state["posts"] = []
+if "safety" not in st.session_state:
+    st.session_state["safety"] = []
 
 with st.form("input_form"):
     col1, col2 = st.columns(2)
@@ -244,9 +652,27 @@ with st.form("input_form"):
 if submitted:
     platforms = [p.strip() for p in platforms_str.split(",") if p.strip()]
 
+    # Posts are previewed here as they stream in (chunks arrive out of order)
+    preview = st.empty()
+    streamed_posts = []
+
+    def show_streamed_post(post: Dict[str, Any]):
+        streamed_posts.append(post)
+        preview.dataframe(
+            [
+                {
+                    "Date": p.get("date", ""),
+                    "Platform": p.get("platform", ""),
+                    "Caption": p.get("caption", ""),
+                }
+                for p in sorted(streamed_posts, key=lambda p: str(p.get("date", "")))
+            ],
+            use_container_width=True,
+        )
+
     with st.spinner("Calling Groq and generating calendar..."):
         try:
-            posts = generate_calendar(
+            args = (
                 f"{brand_name}: {brand_description}",
                 tone,
                 audience,
@@ -255,50 +681,73 @@ if submitted:
                 start_date,
                 int(char_limit),
             )
-            st.session_state["posts"] = posts
+            if use_cache:
+                posts = generate_calendar(*args, on_post=show_streamed_post)
+            else:
+                # Bypass skips the cache for this call only, not for other users
+                posts = build_calendar(
+                    *args, use_cache=False, on_post=show_streamed_post
+                )
+            # Build every derived output before touching session state, so a
+            # failure leaves the previous calendar fully intact
+            display_df, json_bytes, csv_bytes = build_outputs(posts)
+            st.session_state.update(
+                posts=posts,
+                safety=[],
+                display_df=display_df,
+                json_bytes=json_bytes,
+                csv_bytes=csv_bytes,
+            )
             st.success(f"Generated {len(posts)} posts ✅")
         except Exception as e:
             st.error(f"Generation error: {e}")
 
+    preview.empty()
+
 posts = st.session_state.get("posts", [])
 
 if posts:
     st.subheader(f"Generated Posts ({len(posts)})")
 
-    # Prepare data for table display (hashtags as string)
-    display_rows = []
-    for p in posts:
-        display_rows.append(
+    st.dataframe(st.session_state["display_df"], use_container_width=True)
+
+    # Safety check over every caption in one request
+    if st.button("🛡️ Check all captions"):
+        with st.spinner("Checking captions..."):
+            st.session_state["safety"] = safety_check(
+                [p.get("caption", "") for p in posts], use_cache=use_cache
+            )
+
+    safety = st.session_state.get("safety", [])
+    if safety:
+        flagged = [
             {
-                "ID": p.get("id", ""),
-                "Date": p.get("date", ""),
-                "Platform": p.get("platform", ""),
-                "Type": p.get("post_type", ""),
-                "Caption": p.get("caption", ""),
-                "Hashtags": " ".join(p.get("hashtags", []))
-                if isinstance(p.get("hashtags"), list)
-                else p.get("hashtags", ""),
-                "CTA": p.get("CTA", ""),
+                "ID": posts[r["id"]].get("id", ""),
+                "Caption": posts[r["id"]].get("caption", ""),
+                "Suggested replacement": r["replacement"],
             }
-        )
-
-    st.dataframe(display_rows, use_container_width=True)
+            for r in safety
+            if r["status"] != "SAFE"
+        ]
+        if flagged:
+            st.warning(f"{len(flagged)} caption(s) flagged as unsafe")
+            st.dataframe(flagged, use_container_width=True)
+        else:
+            st.success("All captions passed the safety check ✅")
 
     # Download buttons
     col_j, col_c = st.columns(2)
     with col_j:
-        json_bytes = json.dumps(posts, indent=2).encode("utf-8")
         st.download_button(
             label="⬇️ Download JSON",
-            data=json_bytes,
+            data=st.session_state["json_bytes"],
             file_name="calendar.json",
             mime="application/json",
         )
     with col_c:
-        csv_bytes = posts_to_csv(posts)
         st.download_button(
             label="⬇️ Download CSV",
-            data=csv_bytes,
+            data=st.session_state["csv_bytes"],
             file_name="calendar.csv",
             mime="text/csv",
         )
@@ -0,0 +1,193 @@
+"""
+Persistent on-disk cache for Groq chat completion responses.
+Entries are keyed by a SHA-256 of the request payload and expire after a TTL;
+the least recently used entries are evicted once the cache is full.
+SingleFlight coalesces identical requests that are in flight at the same time.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "groq_agent", "responses.json"
+)
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 500
+
+
+def make_key(payload: Dict[str, Any]) -> str:
+    """
+    Stable cache key for a request payload (model, messages, max_tokens, ...).
+    """
+    blob = json.dumps(payload, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()
+
+
+class Cacher:
+    """
+    JSON-file backed response cache with TTL expiry and LRU eviction.
+
+    The file maps cache key -> {"response", "created", "used"}; the "used"
+    timestamp restores LRU order when the cache is reloaded. With path=None
+    the cache is kept in memory only.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = DEFAULT_CACHE_PATH,
+        ttl: float = DEFAULT_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._version = 0
+        self._written_version = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._load()
+
+    def _load(self):
+        if self.path is None:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        if not isinstance(data, dict):
+            return
+
+        # Malformed entries are skipped rather than failing every lookup
+        valid = [(k, e) for k, e in data.items() if self._valid_entry(e)]
+        for key, entry in sorted(valid, key=lambda kv: kv[1]["used"]):
+            self._entries[key] = entry
+
+    @staticmethod
+    def _valid_entry(entry: Any) -> bool:
+        return (
+            isinstance(entry, dict)
+            and isinstance(entry.get("response"), str)
+            and isinstance(entry.get("created"), (int, float))
+            and isinstance(entry.get("used"), (int, float))
+        )
+
+    def _snapshot(self) -> Tuple[int, str]:
+        """
+        Serialize the entries; call with self._lock held. json.dumps takes the
+        C encoder fast path, unlike json.dump which encodes in pure Python.
+        """
+        self._version += 1
+        return self._version, json.dumps(self._entries)
+
+    def _save(self, version: int, blob: str):
+        """
+        Write a snapshot outside self._lock so readers are not blocked on disk
+        I/O. A snapshot older than the last one written is dropped.
+        """
+        if self.path is None:
+            return
+        with self._write_lock:
+            if version <= self._written_version:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(blob)
+            os.replace(tmp_path, self.path)
+            self._written_version = version
+
+    def _expired(self, entry: Dict[str, Any], now: float) -> bool:
+        return now - entry.get("created", 0) > self.ttl
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry, now):
+                del self._entries[key]
+                return None
+            entry["used"] = now
+            self._entries.move_to_end(key)
+            return entry["response"]
+
+    def put(self, key: str, response: str):
+        now = time.time()
+        with self._lock:
+            self._entries[key] = {"response": response, "created": now, "used": now}
+            self._entries.move_to_end(key)
+
+            # Drop expired entries first, then least recently used ones
+            for k in [k for k, e in self._entries.items() if self._expired(e, now)]:
+                del self._entries[k]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+            if self.path is None:
+                return
+            version, blob = self._snapshot()
+
+        try:
+            self._save(version, blob)
+        except OSError:
+            pass  # cache is best-effort; never fail the request over it
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self.path is None:
+                return
+            version, blob = self._snapshot()
+
+        try:
+            self._save(version, blob)
+        except OSError:
+            pass
+
+
+class SingleFlight:
+    """
+    Request coalescing: the first caller for a key runs the function, and
+    callers arriving while it is in flight wait for that same result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Returns (result, shared); shared is True when the result came from
+        another caller's in-flight call.
+        """
+        with self._lock:
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = Future()
+                self._inflight[key] = fut
+
+        if not leader:
+            return fut.result(), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
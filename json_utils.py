@@ -0,0 +1,67 @@
+"""
+JSON parse/serialize helpers with runtime dispatch on payload size.
+Kept out of app.py so CPU detection and per-thread parsers are set up once
+per process instead of on every Streamlit rerun.
+"""
+
+import json
+import threading
+
+try:
+    import orjson
+except ImportError:  # optional speedup, stdlib json is used otherwise
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:  # optional, only used for large payloads
+    simdjson = None
+
+# Parser dispatch by payload size (see json_loads)
+SMALL_JSON_BYTES = 4096
+LARGE_JSON_BYTES = 8192
+
+
+def _cpu_has_avx2() -> bool:
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            return any(
+                line.startswith("flags") and " avx2" in line for line in f
+            )
+    except OSError:  # not Linux; leave the SIMD parser off
+        return False
+
+
+HAS_AVX2 = _cpu_has_avx2()
+
+_simdjson_local = threading.local()
+
+
+def _simdjson_parser():
+    # Parsers are not thread-safe; each long-lived worker thread keeps one
+    # so its padded buffer is reused across parses
+    parser = getattr(_simdjson_local, "parser", None)
+    if parser is None:
+        parser = _simdjson_local.parser = simdjson.Parser()
+    return parser
+
+
+def json_loads(data):
+    """
+    Picks a parser by payload size: stdlib json for tiny bodies (no setup
+    cost), simdjson for large batched responses on AVX2 CPUs, orjson otherwise.
+    """
+    size = len(data)
+    if size < SMALL_JSON_BYTES:
+        return json.loads(data)
+    if size > LARGE_JSON_BYTES and simdjson is not None and HAS_AVX2:
+        return _simdjson_parser().parse(data, recursive=True)
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(obj, indent: bool = False) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else None)
+    return json.dumps(obj, indent=2 if indent else None).encode("utf-8")
@@ -0,0 +1,56 @@
+"""
+Schema for calendar posts returned by the model.
+Kept out of app.py so the model and its TypeAdapter are built once per
+process instead of on every Streamlit rerun.
+"""
+
+from typing import Any, List
+
+from pydantic import (
+    BaseModel,
+    ConfigDict,
+    TypeAdapter,
+    field_validator,
+    model_validator,
+)
+
+
+class Post(BaseModel):
+    """
+    One calendar entry as returned by the model. Missing optional fields
+    default to empty values so every post carries the full set of keys;
+    extra keys from the model are kept, as they were before validation.
+    """
+
+    model_config = ConfigDict(coerce_numbers_to_str=True, extra="allow")
+
+    id: Any = None  # overwritten when posts are renumbered
+    date: str
+    platform: str
+    post_type: str = ""
+    caption: str
+    hashtags: List[str] = []
+    image_prompt: str = ""
+    alt_text: str = ""
+    CTA: str = ""
+
+    @model_validator(mode="before")
+    @classmethod
+    def _drop_nulls(cls, data: Any) -> Any:
+        if isinstance(data, dict):
+            return {k: v for k, v in data.items() if v is not None}
+        return data
+
+    @field_validator("hashtags", mode="before")
+    @classmethod
+    def _split_hashtags(cls, value: Any) -> Any:
+        if isinstance(value, str):
+            return value.split()
+        if isinstance(value, list):
+            # Drop nulls and other non-string items instead of rejecting the post
+            return [h for h in value if isinstance(h, str)]
+        return value
+
+
+# Validates and coerces a whole list in one pydantic-core call
+POSTS_ADAPTER = TypeAdapter(List[Post])